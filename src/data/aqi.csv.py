@@ -1,13 +1,15 @@
 import asyncio
 import os
 import sys
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import List, Tuple
 
 import llm
 import pandas as pd
 from pyairvisual.cloud_api import CloudAPI
 
+from snapshots import call_with_timeout, mark_age, save_snapshot, serve_snapshot
+
 # set debug = True for testing
 # otherwise print statements get added to the final csv
 DEBUG = False
@@ -16,16 +18,41 @@ DEBUG = False
 AIRVISUAL_KEY = os.environ.get("AIRVISUAL_KEY")
 cloud_api = CloudAPI(AIRVISUAL_KEY)
 
+# time budgets in seconds for a fresh AirVisual fetch before falling back
+# to the snapshot, and for the LLM comments on top of it
+FETCH_TIMEOUT = 480
+COMMENT_TIMEOUT = 120
+
+
+async def fetch_air_quality_data():
+    """Fetch cities and their air quality data, raises if nothing came back"""
+    cities = await get_cities()
+    air_quality_df = await get_air_quality_data(cities)
+    if air_quality_df is None:
+        raise RuntimeError("no air quality data returned from AirVisual")
+    return air_quality_df
+
 
 async def main():
     start_time = datetime.now()
 
-    # countries = await cloud_api.supported.countries()
-    states = await cloud_api.supported.states("Pakistan")
-    cities = await get_cities()
+    # make the final df, falling back to the last good one if the
+    # fetch fails or takes too long
+    try:
+        air_quality_df = await asyncio.wait_for(
+            fetch_air_quality_data(), timeout=FETCH_TIMEOUT
+        )
+    except Exception as e:
+        air_quality_df = serve_snapshot("aqi", e)
+    else:
+        commented = add_comments(air_quality_df)
 
-    # make the final df
-    air_quality_df = await get_air_quality_data(cities)
+        # debug runs skip stations, and an LLM outage leaves every comment
+        # blank, so neither replaces the last good snapshot
+        if DEBUG or not commented:
+            air_quality_df = mark_age(air_quality_df, datetime.now(timezone.utc))
+        else:
+            air_quality_df = save_snapshot("aqi", air_quality_df)
 
     end_time = datetime.now()
     duration = end_time - start_time
@@ -518,7 +545,12 @@ async def get_air_quality_data(cities: List[Tuple[str, str]]):
         print(f"Total rows in DataFrame: {len(combined_df)}")
         print(f"Date range: {combined_df['ts'].min()} to {combined_df['ts'].max()}")
 
-    # Add comments for cities' current readings
+    return combined_df
+
+
+def get_city_comments(combined_df, comments: dict):
+    """Fill comments with an LLM comment for each city's current reading,
+    keyed by combined_df index"""
     model = llm.get_model("claude-3-haiku-20240307")
 
     # Create mask for current city readings
@@ -543,14 +575,34 @@ async def get_air_quality_data(cities: List[Tuple[str, str]]):
             combined_df, city_mask, current_date
         )
 
-        # Update comments for this city's current readings
-        city_df = combined_df[city_mask]
-        combined_df.loc[city_mask, "comment"] = city_df.apply(
-            lambda row: get_comment(row, model, yesterday_avgs, tomorrow_avgs),
-            axis=1,
+        # Comment on this city's current readings
+        for index, row in combined_df[city_mask].iterrows():
+            comments[index] = get_comment(row, model, yesterday_avgs, tomorrow_avgs)
+
+
+def add_comments(combined_df) -> bool:
+    """Add LLM comments for cities' current readings within COMMENT_TIMEOUT.
+
+    Comments not finished by the deadline are left blank. Returns False if
+    there were readings to comment on but every comment failed."""
+    comments = {}
+    try:
+        # the LLM calls block, so run them with a deadline of their own
+        # on a copy the abandoned thread can keep reading after a timeout
+        call_with_timeout(
+            get_city_comments, COMMENT_TIMEOUT, combined_df.copy(), comments
         )
+    except Exception as e:
+        print(f"aqi: comments incomplete ({type(e).__name__}: {e})", file=sys.stderr)
 
-    return combined_df
+    comments = dict(comments)
+    for index, comment in comments.items():
+        combined_df.loc[index, "comment"] = comment
+
+    current_city_count = (
+        (combined_df["data_source"] == "city") & (combined_df["data_type"] == "current")
+    ).sum()
+    return current_city_count == 0 or any(comments.values())
 
 
 if __name__ == "__main__":
@@ -2,8 +2,13 @@ import llm
 import pandas as pd
 import sys
 
+from snapshots import call_with_timeout, save_snapshot, serve_snapshot
 
-def main():
+# time budget in seconds for all LLM calls before falling back to the snapshot
+FETCH_TIMEOUT = 60
+
+
+def get_comments():
     # Top 5 Pakistani cities by population
     cities = ["Karachi", "Lahore", "Faisalabad", "Rawalpindi", "Islamabad"]
 
@@ -16,7 +21,17 @@ def main():
         response = model.prompt(prompt, system=system_prompt)
         results.append({"city": city, "text": response.text().strip()})
 
-    df = pd.DataFrame(results)
+    return pd.DataFrame(results)
+
+
+def main():
+    try:
+        df = call_with_timeout(get_comments, FETCH_TIMEOUT)
+    except Exception as e:
+        df = serve_snapshot("aqi_comments", e)
+    else:
+        df = save_snapshot("aqi_comments", df)
+
     df.to_csv(sys.stdout, index=False)
 
 
@@ -7,15 +7,12 @@ import pandas as pd
 from pyairvisual.cloud_api import CloudAPI
 from stamina import retry
 
+from snapshots import save_snapshot, serve_snapshot
+
 DEBUG = False
 
 # air visual API
 AIRVISUAL_KEY = os.environ.get("AIRVISUAL_KEY")
-if not AIRVISUAL_KEY:
-    print("AIRVISUAL_KEY environment variable not set")
-    print("------------------------------------------")
-    sys.exit(1)
-
 cloud_api = CloudAPI(AIRVISUAL_KEY)
 
 
@@ -45,7 +42,17 @@ async def get_ranking(return_original=False):
 
 async def main():
     start_time = datetime.now()
-    df = await get_ranking()
+
+    # once retries are exhausted, serve the last good ranking instead of
+    # failing the whole build
+    try:
+        if not AIRVISUAL_KEY:
+            raise RuntimeError("AIRVISUAL_KEY environment variable not set")
+        df = await get_ranking()
+    except Exception as e:
+        df = serve_snapshot("aqi_ranks", e)
+    else:
+        df = save_snapshot("aqi_ranks", df)
 
     # save to csv for debugging
     if DEBUG:
@@ -0,0 +1,126 @@
+import json
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+# last good output of each data loader, restored between CI runs by the
+# publish workflow so a failed upstream fetch can fall back to it
+SNAPSHOT_DIR = Path(__file__).resolve().parent / ".snapshots"
+
+# snapshots older than this are not served, the build fails instead of
+# showing old AQI as if it were current
+MAX_AGE_HOURS = float(os.environ.get("SNAPSHOT_MAX_AGE_HOURS", 24))
+
+
+def call_with_timeout(func, timeout: float, *args):
+    """Run a blocking call with a deadline, raises TimeoutError past it.
+
+    The call runs in a daemon thread which is abandoned on timeout, so a
+    hung request can't keep the loader process alive."""
+    result = {}
+
+    def target():
+        try:
+            result["value"] = func(*args)
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise TimeoutError(f"{func.__name__} did not finish within {timeout}s")
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def mark_age(df: pd.DataFrame, generated_at: datetime, now: datetime = None):
+    """Add generated_at and age_minutes columns so pages can show data freshness"""
+    now = now or datetime.now(timezone.utc)
+    df = df.copy()
+    df["generated_at"] = generated_at.isoformat(timespec="seconds")
+    df["age_minutes"] = int((now - generated_at).total_seconds() // 60)
+    return df
+
+
+def save_snapshot(name: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Persist a freshly fetched dataframe as the last good output for a loader.
+
+    Returns the dataframe marked with its generation time (age 0)."""
+    generated_at = datetime.now(timezone.utc)
+    meta = {
+        "loader": name,
+        "generated_at": generated_at.isoformat(),
+        "rows": len(df),
+        "columns": list(df.columns),
+    }
+
+    # write to temp files first so an interrupted build never leaves a
+    # half written snapshot behind
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    csv_path = SNAPSHOT_DIR / f"{name}.csv"
+    meta_path = SNAPSHOT_DIR / f"{name}.json"
+    df.to_csv(f"{csv_path}.tmp", index=False)
+    meta_path.with_suffix(".json.tmp").write_text(json.dumps(meta, indent=2))
+    os.replace(f"{csv_path}.tmp", csv_path)
+    os.replace(meta_path.with_suffix(".json.tmp"), meta_path)
+
+    return mark_age(df, generated_at, now=generated_at)
+
+
+def load_snapshot(name: str):
+    """Returns (df, meta) for the last good output of a loader, or None
+    if there is no snapshot or it can't be read"""
+    csv_path = SNAPSHOT_DIR / f"{name}.csv"
+    meta_path = SNAPSHOT_DIR / f"{name}.json"
+    if not (csv_path.exists() and meta_path.exists()):
+        return None
+
+    try:
+        meta = json.loads(meta_path.read_text())
+        meta["generated_at"] = datetime.fromisoformat(meta["generated_at"])
+        df = pd.read_csv(csv_path)
+        if meta["generated_at"].tzinfo is None or len(df) != meta["rows"]:
+            return None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return df, meta
+
+
+def serve_snapshot(
+    name: str, error: Exception, max_age_hours: float = MAX_AGE_HOURS
+) -> pd.DataFrame:
+    """Fall back to the last good output after a failed or timed out fetch.
+
+    Logs to stderr, since stdout is the loader's output. Re-raises the
+    original error if there is no readable snapshot, or it is older than
+    max_age_hours."""
+    snapshot = load_snapshot(name)
+    if snapshot is None:
+        print(f"{name}: fetch failed and no snapshot available", file=sys.stderr)
+        raise error
+
+    df, meta = snapshot
+    generated_at = meta["generated_at"]
+    now = datetime.now(timezone.utc)
+    age_minutes = int((now - generated_at).total_seconds() // 60)
+    if age_minutes > max_age_hours * 60:
+        print(
+            f"{name}: fetch failed and snapshot from {generated_at.isoformat()} "
+            f"is older than {max_age_hours} hours",
+            file=sys.stderr,
+        )
+        raise error
+
+    print(
+        f"{name}: fetch failed ({type(error).__name__}: {error}), "
+        f"serving snapshot from {generated_at.isoformat()} "
+        f"({age_minutes} minutes old, {meta['rows']} rows)",
+        file=sys.stderr,
+    )
+    return mark_age(df, generated_at, now=now)